@@ -45,7 +45,7 @@ extensions = [
     "sphinx.ext.todo",
 ]
 
-autodoc_mock_imports = ["busio", "microcontroller", "micropython"]
+autodoc_mock_imports = ["adafruit_ticks", "busio", "microcontroller", "micropython"]
 
 autodoc_preserve_defaults = True
 
@@ -21,16 +21,19 @@ Implementation Notes
 
 * Adafruit CircuitPython firmware for the supported boards:
   https://circuitpython.org/downloads
+
+* Adafruit's Ticks library: https://github.com/adafruit/Adafruit_CircuitPython_Ticks
 """
 
 __version__ = "0.0.0+auto.0"
 __repo__ = "https://github.com/supcik/CircuitPython_SerialControlledServo.git"
 
 
-import binascii
+import struct
 import time
 
 import busio
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
 from microcontroller import Pin
 from micropython import const
 
@@ -40,6 +43,7 @@ SCSCL_MODE_MOTOR = const(2)
 
 SCSCL_READ_DATA = const(0x02)
 SCSCL_WRITE_DATA = const(0x03)
+SCSCL_SYNC_WRITE = const(0x83)
 SCSCL_BROADCAST_ID = const(0xFE)
 
 SCSCL_MAX_POS = const(1023)
@@ -47,8 +51,15 @@ SCSCL_MAX_POS_SPEED = const(1500)
 SCSCL_MIN_MOTOR_SPEED = const(-1023)
 SCSCL_MAX_MOTOR_SPEED = const(1023)
 
+SCSCL_HEADER_LENGTH = const(4)
 SCSCL_MIN_PACKET_LENGTH = const(6)
-SCSCL_WAITING_DELAY = 0.01
+SCSCL_MAX_PACKET_LENGTH = const(260)
+SCSCL_RX_BUFFER_SIZE = const(512)
+SCSCL_MAX_WRITE_LENGTH = const(32)
+SCSCL_READ_TIMEOUT = 0.05
+SCSCL_READ_DEADLINE_MS = const(100)
+SCSCL_POLL_DELAY = 0.001
+SCSCL_FRAME_CACHE_SIZE = const(256)
 
 # Sources :
 #
@@ -86,12 +97,18 @@ SCSCL_PRESENT_TEMPERATURE = const(0x3F)
 SCSCL_MOVING = const(0x42)
 SCSCL_PRESENT_CURRENT = const(0x45)
 
+# Constant parameters, built once at import time
+_SERVO_MODE_PARAMS = bytes([0x00, 0x01, 0x03, 0xFF])
+_MOTOR_MODE_PARAMS = bytes([0x00, 0x00, 0x00, 0x00])
+_STOP_PARAMS = bytes([0x00])
+
 
 class ScsMessage:
     """Messages for Serial Controlled Servo and Motor Controllers protocol.
     :param int servo_id: The ID of the servo or motor controller (between 1 and 253).
     :param int instruction: The instruction code to send.
-    :param bytearray parameters: The parameters for the instruction.
+    :param bytearray parameters: The parameters for the instruction (any buffer, such as
+        a memoryview, is accepted).
     """
 
     def __init__(self, servo_id: int, instruction: int, parameters: bytearray):
@@ -101,37 +118,34 @@ class ScsMessage:
 
     def checksum(self) -> int:
         """Calculate the checksum for the message."""
-        s = sum(
-            [self.id, len(self.parameters) + 2, self.instruction]
-            + list(self.parameters)
-        )
+        s = self.id + len(self.parameters) + 2 + self.instruction + sum(self.parameters)
         return ~s & 0xFF
 
     def to_bytes(self) -> bytearray:
         """Convert the message to a bytearray."""
-        data_len = len(self.parameters) + 2
-        message = bytearray(data_len + 4)
-        for i, b in enumerate([0xFF, 0xFF, self.id, data_len, self.instruction]):
-            message[i] = b
-        for i, v in enumerate(self.parameters):
-            message[5 + i] = v
-        message[data_len + 3] = self.checksum()
+        n = len(self.parameters)
+        message = bytearray(n + 6)
+        struct.pack_into(
+            ">BBBBB", message, 0, 0xFF, 0xFF, self.id, n + 2, self.instruction
+        )
+        message[5 : 5 + n] = self.parameters
+        message[-1] = self.checksum()
         return message
 
     @staticmethod
     def from_bytes(data: bytearray):
         """Create a Message object from a bytearray.
+        The parameters of the returned message are a view on ``data``, not a copy.
         :param data: The bytearray containing the message data.
         """
-        if len(data) < 6:
+        if len(data) < SCSCL_MIN_PACKET_LENGTH:
             raise ValueError("Data too short to be a valid message")
-        if data[0] != 0xFF or data[1] != 0xFF:
+        mv = memoryview(data)
+        start1, start2, msg_id, length, instruction = struct.unpack_from(">BBBBB", mv)
+        if start1 != 0xFF or start2 != 0xFF:
             raise ValueError("Invalid start bytes")
-        msg_id = data[2]
-        length = data[3]  # Length of the parameters + 2
-        instruction = data[4]
-        parameters = data[5 : length + 3]
-        m = ScsMessage(msg_id, instruction, parameters)
+        # length is the length of the parameters + 2
+        m = ScsMessage(msg_id, instruction, mv[5 : length + 3])
         cs = m.checksum()
         if cs != data[length + 3]:
             raise ValueError(
@@ -142,12 +156,20 @@ class ScsMessage:
     def __repr__(self):
         """Return a string representation of the message."""
         return (
-            f"Message(id={self.id}, "
-            + f"instruction={self.instruction}, "
-            + f"parameters={binascii.hexlify(self.parameters, ",").decode()})"
+            f"Message(id={self.id}, instruction={self.instruction}, "
+            f"parameters={bytes(self.parameters).hex(',')})"
         )
 
 
+_BROADCAST_STOP_FRAME = bytes(
+    ScsMessage(
+        SCSCL_BROADCAST_ID,
+        SCSCL_WRITE_DATA,
+        bytes([SCSCL_TORQUE_ENABLE]) + _STOP_PARAMS,
+    ).to_bytes()
+)
+
+
 class SerialControlledServo:
     """A bus for communicating with Serial Controlled Servo and Motor Controllers.
     :param ~microcontroller.Pin tx_pin: The UART transmit pin.
@@ -157,41 +179,141 @@ class SerialControlledServo:
 
     def __init__(self, tx_pin: Pin, rx_pin: Pin, baud_rate: int = 1000000):
         self._servo_modes = {}
-        self.uart = busio.UART(tx_pin, rx_pin, baudrate=baud_rate)
+        self._frame_cache = {}
+        self._silent_servos = set()
+        self._rx_buf = bytearray(SCSCL_MAX_PACKET_LENGTH)
+        self._tx_params = bytearray(SCSCL_MAX_WRITE_LENGTH)
+        # Set when the last reply was fully read and nothing else is pending
+        self._rx_clean = False
+        # The UART driver fills this buffer from its RX interrupt in the background:
+        # make it large enough to hold a full reply while Python code is busy.
+        self.uart = busio.UART(
+            tx_pin,
+            rx_pin,
+            baudrate=baud_rate,
+            timeout=SCSCL_READ_TIMEOUT,
+            receiver_buffer_size=SCSCL_RX_BUFFER_SIZE,
+        )
+
+    def _read_into(self, buf: memoryview, deadline: int) -> None:
+        # readinto usually blocks until buf is full, but may return early with
+        # a partial read (or None) on some ports: keep reading until deadline.
+        got = 0
+        while got < len(buf):
+            n = self.uart.readinto(buf[got:])
+            if n:
+                got += n
+            elif ticks_less(deadline, ticks_ms()):
+                raise TimeoutError("Timeout waiting for reply")
+            else:
+                time.sleep(SCSCL_POLL_DELAY)
 
     def _read_message(self) -> ScsMessage:
-        payload = bytearray(SCSCL_MIN_PACKET_LENGTH)
-        while self.uart.in_waiting < SCSCL_MIN_PACKET_LENGTH:
-            time.sleep(SCSCL_WAITING_DELAY)
-        self.uart.readinto(payload)
-        param_length = payload[3] - 2
-        if param_length < 0 or param_length > 252:
-            raise ValueError(f"Invalid parameter length: {param_length}")
-        if param_length >= 0:
-            rest = bytearray(param_length)
-            while self.uart.in_waiting < param_length:
-                time.sleep(SCSCL_WAITING_DELAY)
-            self.uart.readinto(rest)
-            payload.extend(rest)
-
-        m = ScsMessage.from_bytes(payload)
-        return m
+        # The reply is read into a buffer owned by the instance: the returned
+        # message is only valid until the next call.
+        deadline = ticks_add(ticks_ms(), SCSCL_READ_DEADLINE_MS)
+        buf = memoryview(self._rx_buf)
+        self._read_into(buf[:SCSCL_HEADER_LENGTH], deadline)
+        data_len = self._rx_buf[3]
+        if data_len < 2 or data_len > 254:
+            raise ValueError(f"Invalid parameter length: {data_len - 2}")
+        self._read_into(
+            buf[SCSCL_HEADER_LENGTH : SCSCL_HEADER_LENGTH + data_len], deadline
+        )
+        return ScsMessage.from_bytes(buf[: SCSCL_HEADER_LENGTH + data_len])
 
-    def _write_memory(self, servo_id: int, addr: int, values: bytearray) -> None:
-        m = ScsMessage(servo_id, SCSCL_WRITE_DATA, bytearray([addr]) + values)
-        self.uart.reset_input_buffer()
-        self.uart.write(m.to_bytes())
+    def _transact(self, frame: bytes) -> ScsMessage:
+        if not self._rx_clean:
+            self.uart.reset_input_buffer()
+        self.uart.write(frame)
+        self._rx_clean = False
         reply = self._read_message()
+        self._rx_clean = True
+        return reply
+
+    def _write_frame(
+        self, servo_id: int, frame: bytes, *, expect_reply: bool = None
+    ) -> None:
+        if expect_reply is None:
+            # Broadcast frames and servos with a response level of 0 never reply
+            expect_reply = (
+                servo_id != SCSCL_BROADCAST_ID and servo_id not in self._silent_servos
+            )
+        if not expect_reply:
+            self.uart.write(frame)
+            # A servo may answer anyway: flush before the next exchange
+            self._rx_clean = False
+            return
+        reply = self._transact(frame)
         if reply.instruction != 0:
             raise ValueError(f"Error writing to servo {servo_id}: {reply.instruction}")
 
-    def _read_memory(self, servo_id: int, addr: int, length: int) -> bytearray:
-        m = ScsMessage(servo_id, SCSCL_READ_DATA, bytearray([addr, length]))
-        self.uart.reset_input_buffer()
-        self.uart.write(m.to_bytes())
-        reply = self._read_message()
+    def _write_memory(
+        self, servo_id: int, addr: int, values: bytearray, *, expect_reply: bool = None
+    ) -> None:
+        m = ScsMessage(servo_id, SCSCL_WRITE_DATA, self._write_params(addr, values))
+        self._write_frame(servo_id, m.to_bytes(), expect_reply=expect_reply)
+
+    def _write_params(self, addr: int, values: bytearray) -> memoryview:
+        # Parameters are staged in a buffer owned by the instance: the returned
+        # view is only valid until the next write.
+        n = 1 + len(values)
+        if n > SCSCL_MAX_WRITE_LENGTH:
+            raise ValueError(f"Too many values to write: {len(values)}")
+        self._tx_params[0] = addr
+        self._tx_params[1:n] = values
+        return memoryview(self._tx_params)[:n]
+
+    def _cache_frame(
+        self, key: tuple, servo_id: int, addr: int, values: bytearray
+    ) -> bytes:
+        m = ScsMessage(servo_id, SCSCL_WRITE_DATA, self._write_params(addr, values))
+        frame = bytes(m.to_bytes())
+        if len(self._frame_cache) >= SCSCL_FRAME_CACHE_SIZE:
+            # Drop one entry to keep the cache bounded on boards with little RAM
+            del self._frame_cache[next(iter(self._frame_cache))]
+        self._frame_cache[key] = frame
+        return frame
+
+    def _read_memory(self, servo_id: int, addr: int, length: int) -> memoryview:
+        m = ScsMessage(servo_id, SCSCL_READ_DATA, struct.pack(">BB", addr, length))
+        reply = self._transact(m.to_bytes())
+        if len(reply.parameters) != length:
+            raise ValueError(
+                f"Error reading from servo {servo_id}: expected {length} bytes, "
+                f"got {len(reply.parameters)}"
+            )
         return reply.parameters
 
+    def _set_mode(self, servo_id: int, mode: int) -> None:
+        if servo_id != SCSCL_BROADCAST_ID and self._servo_modes.get(servo_id) == mode:
+            return
+        params = _SERVO_MODE_PARAMS if mode == SCSCL_MODE_SERVO else _MOTOR_MODE_PARAMS
+        self._write_memory(servo_id, SCSCL_MIN_ANGLE_LIMIT, params)
+        if servo_id == SCSCL_BROADCAST_ID:
+            # Every servo switched: per-servo entries are stale
+            self._servo_modes.clear()
+        self._servo_modes[servo_id] = mode
+
+    @staticmethod
+    def _encode_motor_speed(speed: int) -> int:
+        if not (SCSCL_MIN_MOTOR_SPEED <= speed <= SCSCL_MAX_MOTOR_SPEED):
+            raise ValueError(
+                f"Speed must be between {SCSCL_MIN_MOTOR_SPEED} and {SCSCL_MAX_MOTOR_SPEED}"
+            )
+        # Bit 10 is the direction bit, the lower bits hold the magnitude
+        return -speed if speed < 0 else speed + SCSCL_MAX_MOTOR_SPEED + 1
+
+    def _motor_speed_frame(self, servo_id: int, speed: int) -> bytes:
+        key = (servo_id, SCSCL_GOAL_TIME, speed)
+        frame = self._frame_cache.get(key)
+        if frame is None:
+            encoded = self._encode_motor_speed(speed)
+            frame = self._cache_frame(
+                key, servo_id, SCSCL_GOAL_TIME, struct.pack(">H", encoded)
+            )
+        return frame
+
     def _set_lock(self, servo_id: int) -> None:
         self._write_memory(servo_id, SCSCL_LOCK, bytearray([0x01]))
 
@@ -208,21 +330,14 @@ class SerialControlledServo:
             raise ValueError(f"Position must be between 0 and {SCSCL_MAX_POS}")
         if not (0 <= speed <= SCSCL_MAX_POS_SPEED):
             raise ValueError(f"Speed must be between 0 and {SCSCL_MAX_POS_SPEED}")
-        mode = self._servo_modes.get(id, SCSCL_MODE_NONE)
-        if id == SCSCL_BROADCAST_ID or mode != SCSCL_MODE_SERVO:
-            self._write_memory(
-                servo_id,
-                SCSCL_MIN_ANGLE_LIMIT,
-                bytearray([0x00, 0x01, 0x03, 0xFF]),
+        self._set_mode(servo_id, SCSCL_MODE_SERVO)
+        key = (servo_id, SCSCL_GOAL_POSITION, (pos << 16) | speed)
+        frame = self._frame_cache.get(key)
+        if frame is None:
+            frame = self._cache_frame(
+                key, servo_id, SCSCL_GOAL_POSITION, struct.pack(">HHH", pos, 0, speed)
             )
-            self._servo_modes[servo_id] = SCSCL_MODE_SERVO
-        pos_bytes = pos.to_bytes(2, "big")
-        speed_bytes = speed.to_bytes(2, "big")
-        self._write_memory(
-            servo_id,
-            SCSCL_GOAL_POSITION,
-            bytearray(list(pos_bytes) + [0, 0] + list(speed_bytes)),
-        )
+        self._write_frame(servo_id, frame)
 
     def set_all_positions(self, pos: int, speed: int) -> None:
         """Set the position of all servos or motor controllers.
@@ -236,7 +351,7 @@ class SerialControlledServo:
         :param int servo_id: The ID of the servo or motor controller (between 1 and 253).
         """
         data = self._read_memory(servo_id, SCSCL_PRESENT_POSITION, 0x02)
-        return int.from_bytes(data, "big")
+        return (data[0] << 8) | data[1]
 
     def set_motor_speed(self, servo_id: int, speed: int):
         """Set the servo to operate as a motor and set its speed.
@@ -245,28 +360,9 @@ class SerialControlledServo:
         Positive values are for clockwise rotation, negative values
         are for counter-clockwise rotation.
         """
-        if not (SCSCL_MIN_MOTOR_SPEED <= speed <= SCSCL_MAX_MOTOR_SPEED):
-            raise ValueError(
-                f"Speed must be between {SCSCL_MIN_MOTOR_SPEED} and {SCSCL_MAX_MOTOR_SPEED}"
-            )
-        mode = self._servo_modes.get(servo_id, SCSCL_MODE_NONE)
-        if id == SCSCL_BROADCAST_ID or mode != SCSCL_MODE_MOTOR:
-            self._write_memory(
-                servo_id,
-                SCSCL_MIN_ANGLE_LIMIT,
-                bytearray([0x00, 0x00, 0x00, 0x00]),
-            )
-            self._servo_modes[servo_id] = SCSCL_MODE_MOTOR
-        if speed < 0:
-            speed = abs(speed)
-        else:
-            speed += SCSCL_MAX_MOTOR_SPEED + 1
-        speed_bytes = speed.to_bytes(2, "big")
-        self._write_memory(
-            servo_id,
-            SCSCL_GOAL_TIME,
-            bytearray(list(speed_bytes)),
-        )
+        frame = self._motor_speed_frame(servo_id, speed)
+        self._set_mode(servo_id, SCSCL_MODE_MOTOR)
+        self._write_frame(servo_id, frame)
 
     def set_all_motor_speeds(self, speed: int) -> None:
         """Set the speed of all servos or motor controllers as motors.
@@ -276,15 +372,70 @@ class SerialControlledServo:
         """
         self.set_motor_speed(SCSCL_BROADCAST_ID, speed)
 
+    def precompute_motor_frames(self, servo_id: int, speeds: list) -> list:
+        """Encode a table of motor speed commands for a servo.
+        The returned frames can be sent with :meth:`send_frame`, which skips
+        all encoding work when cycling through a fixed set of speeds.
+        :param int servo_id: The ID of the servo or motor controller (between 1 and 253).
+        :param list speeds: The speeds to encode (each between -1023 and 1023).
+        """
+        return [self._motor_speed_frame(servo_id, speed) for speed in speeds]
+
+    def send_frame(self, frame: bytes) -> None:
+        """Send a frame built by :meth:`precompute_motor_frames`.
+        The target servo is switched to motor mode first if needed.
+        :param bytes frame: The encoded frame.
+        """
+        servo_id = frame[2]
+        self._set_mode(servo_id, SCSCL_MODE_MOTOR)
+        self._write_frame(servo_id, frame)
+
+    def sync_write_motor_speeds(self, speeds: dict) -> None:
+        """Set the speed of several servos or motor controllers in a single frame.
+        Servos that are not known to be in motor mode are switched first.
+        :param dict speeds: A mapping from servo ID (between 1 and 253) to
+        speed (between -1023 and 1023).
+        """
+        count = len(speeds)
+        if count == 0:
+            return
+        if 2 + 3 * count > 252:
+            raise ValueError("Too many servos for a single sync write")
+        params = bytearray(2 + 3 * count)
+        params[0] = SCSCL_GOAL_TIME
+        params[1] = 2  # Data length per servo
+        offset = 2
+        for servo_id, speed in speeds.items():
+            struct.pack_into(
+                ">BH", params, offset, servo_id, self._encode_motor_speed(speed)
+            )
+            offset += 3
+        for servo_id in speeds:
+            self._set_mode(servo_id, SCSCL_MODE_MOTOR)
+        m = ScsMessage(SCSCL_BROADCAST_ID, SCSCL_SYNC_WRITE, params)
+        self._write_frame(SCSCL_BROADCAST_ID, m.to_bytes())
+
+    def set_write_reply(self, servo_id: int, enabled: bool) -> None:
+        """Declare whether a servo replies to write commands.
+        Servos configured with a response level of 0 only reply to read
+        commands; waiting for a write reply from them would time out.
+        :param int servo_id: The ID of the servo or motor controller (between 1 and 253).
+        :param bool enabled: ``False`` if the servo does not reply to writes.
+        """
+        if enabled:
+            self._silent_servos.discard(servo_id)
+        else:
+            self._silent_servos.add(servo_id)
+
     def stop(self, servo_id: int) -> None:
         """Stop a servo or motor controller.
         :param int servo_id: The ID of the servo or motor controller (between 1 and 253).
         """
-        self._write_memory(servo_id, SCSCL_TORQUE_ENABLE, bytearray([0x00]))
+        self._write_memory(servo_id, SCSCL_TORQUE_ENABLE, _STOP_PARAMS)
 
     def stop_all(self) -> None:
         """Stop all servos or motor controllers."""
-        self.stop(SCSCL_BROADCAST_ID)
+        self._write_frame(SCSCL_BROADCAST_ID, _BROADCAST_STOP_FRAME)
 
     def change_id(self, old_servo_id: int, new_servo_id: int) -> None:
         """Change the ID of a servo
@@ -295,6 +446,10 @@ class SerialControlledServo:
         self._release_lock(old_servo_id)
         self._write_memory(old_servo_id, SCSCL_ID, bytearray([new_servo_id]))
         self._set_lock(new_servo_id)
+        # Whatever was known about either ID no longer matches the hardware
+        self._servo_modes.pop(old_servo_id, None)
+        self._servo_modes.pop(new_servo_id, None)
+        self._silent_servos.discard(old_servo_id)
 
     def is_moving(self, servo_id: int) -> bool:
         """Check if a servo or motor controller is currently moving.
@@ -308,11 +463,20 @@ class SerialControlledServo:
         :param int servo_id: The ID of the servo or motor controller (between 1 and 253).
         """
         data = self._read_memory(servo_id, SCSCL_PRESENT_LOAD, 0x02)
-        return int.from_bytes(data, "big")
+        return (data[0] << 8) | data[1]
 
     def speed(self, servo_id: int) -> int:
         """Get the current speed of a servo or motor controller.
         :param int servo_id: The ID of the servo or motor controller (between 1 and 253).
         """
         data = self._read_memory(servo_id, SCSCL_PRESENT_SPEED, 0x02)
-        return int.from_bytes(data, "big")
+        return (data[0] << 8) | data[1]
+
+    def read_state(self, servo_id: int) -> tuple:
+        """Get the position, speed, load, voltage and temperature of a servo
+        or motor controller in a single read.
+        The values are returned raw, as by :meth:`position`, :meth:`speed` and :meth:`load`.
+        :param int servo_id: The ID of the servo or motor controller (between 1 and 253).
+        """
+        data = self._read_memory(servo_id, SCSCL_PRESENT_POSITION, 0x08)
+        return struct.unpack_from(">HHHBB", data)